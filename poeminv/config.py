@@ -17,6 +17,7 @@
 # repository. If not, see <https://www.gnu.org/licenses/>.
 
 import abc
+import bisect
 import collections.abc as ca
 import dataclasses as dc
 import enum
@@ -85,7 +86,7 @@ class EngineNOxTier(util.ValueContainsIntEnum):
     TIER3: int = 3
 
 
-@dc.dataclass
+@dc.dataclass(slots=True)
 class VesselInfo:
     max_speed: ev.Speed
     engine_kw: nr.Number
@@ -120,10 +121,48 @@ class Range:
         self._ge = ge
         self._lt = lt
 
+    @property
+    def ge(self) -> nr.Number:
+        return self._ge
+
+    @property
+    def lt(self) -> nr.Number:
+        return self._lt
+
     def __contains__(self, value: nr.Number) -> bool:
         return self._ge <= value < self._lt
 
 
+class RangeLookup:
+    """
+    Lookup of values associated with ranges.
+
+    Takes a sequence of (Range, value) pairs and finds the value of the first
+    range containing a number. If the ranges are sorted and don't overlap, this
+    is a binary search, otherwise the ranges are checked in order.
+    """
+    def __init__(self, range_values: ca.Sequence[tuple[Range, t.Any]]) -> None:
+        self._range_values = range_values
+        ranges = [r for r, _ in range_values]
+        self._is_sorted = (
+            all(r.ge <= r.lt for r in ranges)
+            and all(r1.lt <= r2.ge for r1, r2 in zip(ranges, ranges[1:])))
+        self._starts = [r.ge for r in ranges]
+
+    def get(self, number: nr.Number, default: t.Any = None) -> t.Any:
+        if not self._is_sorted:
+            for range_, value in self._range_values:
+                if number in range_:
+                    return value
+            return default
+        i = bisect.bisect_right(self._starts, number) - 1
+        if i >= 0:
+            range_, value = self._range_values[i]
+            if number in range_:
+                return value
+        return default
+
+
 class CriterionMeta(abc.ABCMeta):
     def __new__(cls, *args, **kwargs):
         instance = super().__new__(cls, *args, **kwargs)
@@ -242,6 +281,8 @@ class MatchConfig:
     Basically a dictionary of data, along with some criteria that can be
     checked against values to see if the data is relevant to them.
     """
+    __slots__ = ('criteria', 'data')
+
     def __init__(self, match_config: dict) -> None:
         """
         Create a MatchConfig.
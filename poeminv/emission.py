@@ -16,8 +16,11 @@
 # along with this program, in the file LICENSE at the top level of this
 # repository. If not, see <https://www.gnu.org/licenses/>.
 
+import collections.abc as ca
+import functools as ft
 import logging
 import numbers as nr
+import typing as t
 
 import pendulum
 
@@ -26,6 +29,22 @@ import poeminv.event as ev
 import poeminv.util as util
 
 
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _accumulate(total, emissions):
+    # Same as total + emissions, but updates total in place rather than
+    # creating a new dictionary for every term of a sum.
+    for pollutant, amount in emissions.items():
+        total[pollutant] = total.get(pollutant, 0) + amount
+    return total
+
+
 class SegmentDurationSanitizer:
     def __init__(
             self, max_fuel_calc_distance_deviation: nr.Number = 0.25,
@@ -89,16 +108,113 @@ class EmissionCalculator:
     A calculator instance is specific to a vessel, information about which is
     passed on construction. It needs a config in which it can look up emission
     factors and data related to the vessel.
+
+    The emission config for the vessel is looked up once per mode and reused
+    afterwards. Assigning a new config or vessel info discards these, but
+    changes made to them in place aren't picked up.
+
+    Optionally, energy amounts can be rounded to a multiple of
+    kwh_quantization before emissions are calculated from them. This trades
+    some accuracy for speed on long tracks, since emissions calculated for
+    the same emission config and rounded amount of energy are then cached.
+    The cache is keyed on the emission config, so only hashable configs are
+    cached, and they must not be modified once in use. By default, no
+    rounding or caching takes place.
     """
+    TRACK_MODES = frozenset({ev.Mode.TRANSIT, ev.Mode.MANEUVERING})
+    MOORING_MODES = frozenset({ev.Mode.HOTELLING, ev.Mode.ANCHORAGE})
+
     def __init__(
-        self, config: cfg.Config, vessel_info: cfg.VesselInfo,
-        segment_duration_sanitizer:
-        SegmentDurationSanitizer = SegmentDurationSanitizer()
-    ) -> None:
+            self, config: cfg.Config, vessel_info: cfg.VesselInfo,
+            segment_duration_sanitizer: SegmentDurationSanitizer = (
+                SegmentDurationSanitizer()),
+            kwh_quantization: t.Optional[nr.Number] = None) -> None:
+        self._emission_configs = {}
+        self._low_load_lookups = {}
         self.config = config
         self.vessel_info = vessel_info
         self.segment_duration_sanitizer = segment_duration_sanitizer
+        self.kwh_quantization = kwh_quantization
         self.logger = logging.getLogger(f'{__name__}.{type(self).__name__}')
+        self._cached_emissions_from_energy = ft.lru_cache(maxsize=4096)(
+            self._uncached_emissions_from_energy)
+
+    @property
+    def config(self) -> cfg.Config:
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        self._emission_configs.clear()
+        self._low_load_lookups.clear()
+
+    @property
+    def vessel_info(self) -> cfg.VesselInfo:
+        return self._vessel_info
+
+    @vessel_info.setter
+    def vessel_info(self, vessel_info):
+        self._vessel_info = vessel_info
+        self._emission_configs.clear()
+        self._low_load_lookups.clear()
+
+    @property
+    def kwh_quantization(self) -> t.Optional[nr.Number]:
+        return self._kwh_quantization
+
+    @kwh_quantization.setter
+    def kwh_quantization(self, kwh_quantization):
+        if kwh_quantization is not None and not kwh_quantization > 0:
+            raise ValueError('kwh_quantization must be positive.')
+        self._kwh_quantization = kwh_quantization
+
+    def _emissions_from_energy(self, emission_config, engine_group, kwh):
+        if self.kwh_quantization is None:
+            # Exact amounts of energy rarely repeat, so caching wouldn't pay.
+            return self._uncached_emissions_from_energy(
+                emission_config, engine_group, kwh)
+        kwh = round(kwh / self.kwh_quantization) * self.kwh_quantization
+        try:
+            return self._cached_emissions_from_energy(
+                emission_config, engine_group, kwh)
+        except TypeError:
+            if _is_hashable(emission_config):
+                raise
+            return self._uncached_emissions_from_energy(
+                emission_config, engine_group, kwh)
+
+    @staticmethod
+    def _uncached_emissions_from_energy(emission_config, engine_group, kwh):
+        # The result is shared between cache hits. Callers must copy it before
+        # making changes.
+        return emission_config.emissions_from_energy(engine_group, kwh)
+
+    def _emission_config_for(self, mode):
+        try:
+            return self._emission_configs[mode]
+        except KeyError:
+            emission_config = self.config.emission_config_for(
+                self.vessel_info, mode)
+            self._emission_configs[mode] = emission_config
+            return emission_config
+
+    def _low_load_lookup_for(self, mode):
+        try:
+            return self._low_load_lookups[mode]
+        except KeyError:
+            low_load_lookup = cfg.RangeLookup(
+                self._emission_config_for(mode).low_load_adjustment_factors)
+            self._low_load_lookups[mode] = low_load_lookup
+            return low_load_lookup
+
+    @staticmethod
+    def _is_one_of(mode, modes):
+        try:
+            return mode in modes
+        except TypeError:
+            # Unhashable values can't be modes.
+            return False
 
     def calculate_track_emissions(
             self, track: ev.Track,
@@ -119,23 +235,49 @@ class EmissionCalculator:
         mode must be one of Mode.TRANSIT or Mode.MANEUVERING, or a ValueError
         is raised.
 
+        The loads at all positions are calculated at once with
+        propulsion_loads_at_stws(), and each load is shared by the segments on
+        either side of its position. If a subclass overrides
+        segment_propulsion_emissions(), that is called for each segment
+        instead. If it overrides propulsion_load_at_stw() but not
+        propulsion_loads_at_stws(), loads are calculated one at a time with
+        that.
+
         Returns a dictionary mapping names of pollutants to their amount in
         grams.
         """
-        if mode not in (ev.Mode.TRANSIT, ev.Mode.MANEUVERING):
+        if not self._is_one_of(mode, self.TRACK_MODES):
             raise ValueError(f'Invalid mode {mode} for track emissions.')
-        emission_config = self.config.emission_config_for(
-            self.vessel_info, mode)
-        total_emissions = self._propulsion_emissions(track, emission_config)
+        emission_config = self._emission_config_for(mode)
+        total_emissions = self._propulsion_emissions(
+            track, emission_config, self._low_load_lookup_for(mode))
+        duration = track.duration
         for engine_group in ('auxiliary', 'boiler'):
-            total_emissions += self._non_propulsion_emissions(
-                track.duration, emission_config, engine_group)
+            _accumulate(
+                total_emissions,
+                self._non_propulsion_emissions(
+                    duration, emission_config, engine_group))
         return total_emissions
 
-    def _propulsion_emissions(self, track, emission_config):
-        emissions = sum((
-            self.segment_propulsion_emissions(s, emission_config)
-            for s in track.segments), start=util.OpDict())
+    def _propulsion_emissions(self, track, emission_config, low_load_lookup):
+        # Segments connect successive positions, so the load at each position
+        # is calculated once and used for the segments on either side of it.
+        emissions = util.OpDict()
+        if self._overrides('segment_propulsion_emissions'):
+            for segment in track.segments:
+                _accumulate(
+                    emissions,
+                    self.segment_propulsion_emissions(
+                        segment, emission_config))
+        elif track.segments:
+            loads = self._loads_at_stws(p.stw for p in track.positions)
+            for segment, start_load, end_load in zip(track.segments, loads,
+                                                     loads[1:]):
+                _accumulate(
+                    emissions,
+                    self._segment_propulsion_emissions(
+                        segment, (start_load + end_load) / 2, emission_config,
+                        low_load_lookup))
         if not emissions:
             self.logger.warning(
                 f'No propulsion emissions calculated for {self.vessel_info} '
@@ -145,37 +287,77 @@ class EmissionCalculator:
     def segment_propulsion_emissions(
             self, segment: ev.Segment, emission_config: cfg.EmissionConfig
     ) -> util.OpDict[str, nr.Number]:
+        """
+        Calculate the propulsion emissions along a single segment.
+
+        calculate_track_emissions() only uses this if it is overridden, see
+        there.
+        """
+        return self._segment_propulsion_emissions(
+            segment, self._segment_load(segment), emission_config,
+            cfg.RangeLookup(emission_config.low_load_adjustment_factors))
+
+    def _segment_propulsion_emissions(
+            self, segment, load, emission_config, low_load_lookup):
         segment_hours = (
             self.segment_duration_sanitizer.adjusted_segment_hours(segment))
-        load = self._segment_load(segment)
         kwh = self.vessel_info.engine_kw * segment_hours * load
         base_emissions = util.OpDict(
-            emission_config.emissions_from_energy('propulsion', kwh))
-        return self._adjusted_emissions(base_emissions, load, emission_config)
+            self._emissions_from_energy(emission_config, 'propulsion', kwh))
+        return self._adjusted_emissions(base_emissions, load, low_load_lookup)
 
     def _segment_load(self, segment):
-        start_load = self.propulsion_load_at_stw(segment.start.stw)
-        end_load = self.propulsion_load_at_stw(segment.end.stw)
+        start_load, end_load = self._loads_at_stws(
+            (segment.start.stw, segment.end.stw))
         return (start_load + end_load) / 2
 
+    def _loads_at_stws(self, stws):
+        if (self._overrides('propulsion_load_at_stw')
+                and not self._overrides('propulsion_loads_at_stws')):
+            return [self.propulsion_load_at_stw(stw) for stw in stws]
+        return self.propulsion_loads_at_stws(stws)
+
+    def _overrides(self, method_name):
+        return (
+            getattr(type(self), method_name)
+            is not getattr(EmissionCalculator, method_name))
+
     def propulsion_load_at_stw(self, stw: ev.Speed) -> nr.Number:
-        fraction_of_max_speed = stw / self.vessel_info.max_speed
-        load = fraction_of_max_speed**3
-        load *= self.config.sea_margin_adjustment_factor
-        return min(load, 1)
-
-    def _adjusted_emissions(self, base_emissions, load, emission_config):
-        for load_range, adjustment_factors in (
-                emission_config.low_load_adjustment_factors):
-            if load in load_range:
-                return base_emissions * adjustment_factors
-        return base_emissions
+        """
+        Calculate the propulsion load at a single stw.
+
+        A shorthand for propulsion_loads_at_stws(), which is what the emission
+        calculations use unless only this is overridden.
+        """
+        return self.propulsion_loads_at_stws((stw,))[0]
+
+    def propulsion_loads_at_stws(
+            self, stws: ca.Iterable[ev.Speed]) -> list[nr.Number]:
+        """
+        Calculate the propulsion load at each of the given stws.
+
+        Same as propulsion_load_at_stw(), but for many values at once, looking
+        up max speed and sea margin only once.
+        """
+        max_speed = self.vessel_info.max_speed
+        sea_margin_adjustment_factor = self.config.sea_margin_adjustment_factor
+        uncapped_loads = [(stw / max_speed)**3 * sea_margin_adjustment_factor
+                          for stw in stws]
+        # Same as min(load, 1), but without the function call.
+        return [1 if load > 1 else load for load in uncapped_loads]
+
+    def _adjusted_emissions(self, base_emissions, load, low_load_lookup):
+        adjustment_factors = low_load_lookup.get(load)
+        if adjustment_factors is None:
+            return base_emissions
+        return base_emissions * adjustment_factors
 
     def _non_propulsion_emissions(
             self, duration, emission_config, engine_group):
         kw = emission_config.engine_power(engine_group)
         kwh = kw * duration.total_hours()
-        emissions = emission_config.emissions_from_energy(engine_group, kwh)
+        emissions = self._emissions_from_energy(
+            emission_config, engine_group, kwh)
         if not emissions:
             self.logger.warning(
                 f'No {engine_group} emissions calculated for '
@@ -198,11 +380,13 @@ class EmissionCalculator:
         Returns a dictionary mapping names of pollutants to their amount in
         grams.
         """
-        if mode not in (ev.Mode.HOTELLING, ev.Mode.ANCHORAGE):
+        if not self._is_one_of(mode, self.MOORING_MODES):
             raise ValueError(f'Invalid mode {mode} for mooring emissions.')
-        emission_config = self.config.emission_config_for(
-            self.vessel_info, mode)
-        return sum((
-            self._non_propulsion_emissions(
-                duration, emission_config, engine_group)
-            for engine_group in ('auxiliary', 'boiler')), start=util.OpDict())
+        emission_config = self._emission_config_for(mode)
+        total_emissions = util.OpDict()
+        for engine_group in ('auxiliary', 'boiler'):
+            _accumulate(
+                total_emissions,
+                self._non_propulsion_emissions(
+                    duration, emission_config, engine_group))
+        return total_emissions
@@ -20,9 +20,11 @@ import collections as cl
 import collections.abc as ca
 import datetime
 import enum
+import itertools as it
 import logging
 import math
 import numbers as nr
+import operator as op
 import typing as t
 
 import pendulum
@@ -40,16 +42,6 @@ def _attr_repr(self, attr_names):
     return '<{}: {{{}}}>'.format(type(self).__name__, members_str)
 
 
-def _attr_eq(self, other, attr_names):
-    for attr_name in attr_names:
-        try:
-            if getattr(self, attr_name) != getattr(other, attr_name):
-                return False
-        except AttributeError:
-            return False
-    return True
-
-
 def always_true(*args, **kwargs) -> t.Literal[True]:
     return True
 
@@ -103,6 +95,9 @@ def great_circle_distance(
         lon1: Longitude, lat1: Latitude, lon2: Longitude,
         lat2: Latitude) -> nr.Number:
     """Calculate the great-circle distance in meters."""
+    # Common for successive positions of moored vessels.
+    if lon1 == lon2 and lat1 == lat2:
+        return 0.0
     lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
     dlat = lat2 - lat1
     dlon = lon2 - lon1
@@ -127,13 +122,23 @@ def bearing(
         (math.degrees(math.atan2(target_lon, target_lat)) + 360) % 360)
 
 
+def _duration_between(
+        start: datetime.datetime, end: datetime.datetime) -> pendulum.Duration:
+    # Subtracting as plain datetimes gives a timedelta, which is much cheaper
+    # than the Period created by pendulum's subtraction. Unlike a Period, the
+    # resulting Duration counts weeks and days rather than calendar months.
+    delta = datetime.datetime.__sub__(end, start)
+    return pendulum.duration(
+        days=delta.days, seconds=delta.seconds,
+        microseconds=delta.microseconds)
+
+
 def average_bearing(b1: Bearing, b2: Bearing) -> Bearing:
-    if abs(b1 - b2) > 180:
-        if b1 < b2:
-            b1 += 360
-        else:
-            b2 += 360
-    return Bearing(((b1 + b2) / 2) % 360)
+    # If the bearings are more than 180 degrees apart, the shorter arc between
+    # them crosses north. Shifting one of them by 360 degrees is the same as
+    # shifting their sum, which avoids branching on which one is smaller.
+    wraps = abs(b1 - b2) > 180
+    return Bearing(((b1 + b2 + 360 * wraps) / 2) % 360)
 
 
 def surrounding_context_iter(
@@ -177,12 +182,21 @@ class Position:
     heading into which the tide is flowing, e.g. if it is 0, the water is
     flowing from south to north.
 
-    The tide_flow and tide_bearing attributes can be changed after
+    The cog, tide_flow, and tide_bearing attributes can be changed after
     construction, which causes the stw property to be recalculated to reflect
     the changes.
     """
+    __slots__ = (
+        'ts', 'lon', 'lat', '_sog', '_cog', 'heading', '_tide_flow',
+        '_tide_bearing', '_cos_tide_angle', '_stw')
     _attributes = (
         'ts', 'lon', 'lat', 'cog', 'heading', 'tide_flow', 'tide_bearing')
+    _attribute_values = op.attrgetter(*_attributes)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Subclasses may extend _attributes.
+        cls._attribute_values = op.attrgetter(*cls._attributes)
 
     def __init__(
             self, ts: datetime.datetime, lon: Longitude, lat: Latitude,
@@ -192,22 +206,65 @@ class Position:
         self.lon = Longitude(lon)
         self.lat = Latitude(lat)
         self._sog = Speed(sog)
-        self.cog = Bearing(cog)
+        self.cog = cog
         self.heading = Bearing(heading)
-        self.tide_flow = Speed(tide_flow)
-        self.tide_bearing = Bearing(tide_bearing)
+        self.tide_flow = tide_flow
+        self.tide_bearing = tide_bearing
         self._stw = None if stw is None else Bearing(stw)
 
+    @classmethod
+    def _unchecked(
+            cls, ts: pendulum.DateTime, lon: nr.Number, lat: nr.Number,
+            sog: nr.Number, cog: nr.Number, heading: nr.Number,
+            tide_flow: nr.Number, tide_bearing: nr.Number) -> t.Self:
+        """
+        Create a position from values that are known to be valid.
+
+        Skips validation via Longitude, Latitude, Speed, and Bearing, which is
+        useful when a whole track's values have already been validated at
+        once. Values are still converted to float, like those types do. Only
+        used for classes that don't override __init__().
+        """
+        position = cls.__new__(cls)
+        position.ts = ts
+        position.lon = float(lon)
+        position.lat = float(lat)
+        position._sog = float(sog)
+        position._cog = float(cog)
+        position.heading = float(heading)
+        position._tide_flow = float(tide_flow)
+        position._tide_bearing = float(tide_bearing)
+        position._cos_tide_angle = None
+        position._stw = None
+        return position
+
     def __repr__(self):
-        return _attr_repr(self, self._attributes)
+        members_str = ', '.join(
+            f'{k}: {repr(v)}'
+            for k, v in zip(self._attributes, self._attribute_values(self)))
+        return f'<{type(self).__name__}: {{{members_str}}}>'
 
     def __eq__(self, other):
-        return _attr_eq(self, other, self._attributes)
+        try:
+            return (
+                self._attribute_values(self) == self._attribute_values(other))
+        except AttributeError:
+            return False
 
     @property
     def sog(self) -> Speed:
         return self._sog
 
+    @property
+    def cog(self) -> Bearing:
+        return self._cog
+
+    @cog.setter
+    def cog(self, value):
+        self._cog = Bearing(value)
+        self._cos_tide_angle = None
+        self._stw = None
+
     @property
     def tide_flow(self) -> Speed:
         return self._tide_flow
@@ -224,29 +281,35 @@ class Position:
     @tide_bearing.setter
     def tide_bearing(self, value):
         self._tide_bearing = Bearing(value)
+        self._cos_tide_angle = None
         self._stw = None
 
     @property
     def stw(self) -> Speed:
         if self._stw is None:
-            self._stw = self._speed_through_water(
-                self.sog, self.cog, self.tide_flow, self.tide_bearing)
+            self._stw = self._speed_through_water()
         return self._stw
 
-    @staticmethod
-    def _speed_through_water(sog, cog, tide_flow, tide_bearing):
+    def _speed_through_water(self):
         """
         Calculate the speed through water considering tide current.
 
-        The speeds must be the same unit, which will also be the unit of the
-        output. cog and tide_bearing must be in degrees.
+        The cosine of the angle between cog and tide_bearing is kept until
+        either of them changes, so that changing only tide_flow doesn't
+        require any trigonometry.
         """
+        sog = self._sog
+        tide_flow = self._tide_flow
         if not tide_flow:
             return sog
-        cos_angle = math.cos(math.radians(cog - tide_bearing))
+        cos_angle = self._cos_tide_angle
+        if cos_angle is None:
+            cos_angle = math.cos(math.radians(self._cog - self._tide_bearing))
+            self._cos_tide_angle = cos_angle
         return Speed(
             math.sqrt(
-                sog**2 + tide_flow**2 - (2 * sog * tide_flow * cos_angle)))
+                sog * sog + tide_flow * tide_flow
+                - (2 * sog * tide_flow * cos_angle)))
 
 
 class Segment:
@@ -256,8 +319,10 @@ class Segment:
     Represents the connection between 2 individual positions. Has a distance
     and a duration, which are calculated from coordinates and timestamps of the
     positions. The distance can be passed on constructionn if it is already
-    known.
+    known. Both are calculated when first accessed and kept afterwards.
     """
+    __slots__ = ('start', 'end', '_distance', '_duration')
+
     def __init__(
             self, start: Position, end: Position,
             distance: t.Optional[nr.Number] = None):
@@ -266,6 +331,7 @@ class Segment:
         self.start = start
         self.end = end
         self._distance = distance
+        self._duration = None
 
     def __repr__(self):
         return _attr_repr(self, ('start', 'end'))
@@ -280,7 +346,9 @@ class Segment:
 
     @property
     def duration(self) -> pendulum.Duration:
-        return self.end.ts.diff(self.start.ts)
+        if self._duration is None:
+            self._duration = _duration_between(self.start.ts, self.end.ts)
+        return self._duration
 
 
 class Track:
@@ -368,8 +436,15 @@ class Track:
             'num_discarded': 0, 'num_sogs': 0, 'num_cogs': 0,
             'num_headings': 0, 'sogs': set()}
         track = cls()
+        rows, segment_distances = [], []
+        last_kept = None
+        # Distances between successive position dicts, if they have already
+        # been calculated. The distance to the future position at one step is
+        # the distance from the past position at the next.
+        future_distance = None
         for past, current, future in surrounding_context_iter(position_dicts,
                                                               3, 1):
+            past_distance, future_distance = future_distance, None
             if cls._position_is_outlier(current, past,
                                         distance_covered_is_plausible):
                 sanitizations['num_discarded'] += 1
@@ -386,16 +461,38 @@ class Track:
             if sog is None or not sog_is_plausible(sog):
                 sanitizations['num_sogs'] += 1
                 sanitizations['sogs'].add(sog)
-                sog = cls._calculate_sog(current, past, future)
+                sog, past_distance, future_distance = cls._calculate_sog(
+                    current, past, future, past_distance)
             if cog is None:
                 sanitizations['num_cogs'] += 0
                 cog = cls._calculate_cog(current, past, future)
             if heading is None:
                 sanitizations['num_headings'] += 1
                 heading = cog
-            track.append_position(
+            rows.append((
                 pendulum.from_timestamp(current['ts']), current['lon'],
-                current['lat'], sog, cog, heading, tide_flow, tide_bearing)
+                current['lat'], sog, cog, heading, tide_flow, tide_bearing))
+            if past and past[-1] is last_kept:
+                segment_distances.append(past_distance)
+            else:
+                segment_distances.append(None)
+            last_kept = current
+        if rows:
+            _, *columns = zip(*rows)
+            cls._assert_valid_columns(*columns)
+        # Subclasses may do additional work when positions are created or
+        # appended, so the shortcuts can only be taken if they don't override
+        # the respective methods.
+        if type(track).append_position is not Track.append_position:
+            for row in rows:
+                track.append_position(*row)
+        else:
+            if track.position_class.__init__ is Position.__init__:
+                make_position = track.position_class._unchecked
+            else:
+                make_position = track.position_class
+            for row, distance in zip(rows, segment_distances):
+                track._append(make_position(*row), distance)
         if any(sanitizations.values()):
             logging.getLogger(f'{__name__}.{cls.__name__}').debug(
                 'Sanitization during track creation: '
@@ -405,6 +502,22 @@ class Track:
                 f'{sanitizations["num_headings"]} headings.')
         return track
 
+    @staticmethod
+    def _assert_valid_columns(
+            lons, lats, sogs, cogs, headings, tide_flows, tide_bearings):
+        # Uses the exact same checks as the Longitude, Latitude, Speed, and
+        # Bearing types, so that the same values (e.g. NaN speeds) are
+        # accepted, but once for a whole track and without creating instances.
+        if not all(-180 <= lon < 180 for lon in lons):
+            raise ValueError('Longitudes must be in range [-180, 180).')
+        if not all(-90 <= lat <= 90 for lat in lats):
+            raise ValueError('Latitudes must be in range [-90, 90].')
+        if not all(not speed < 0 for speed in it.chain(sogs, tide_flows)):
+            raise ValueError('Speeds must be non-negative.')
+        if not all(0 <= bearing < 360
+                   for bearing in it.chain(cogs, headings, tide_bearings)):
+            raise ValueError('Bearings must be in range [0, 360).')
+
     @classmethod
     def _position_is_outlier(
             cls, current, past, distance_covered_is_plausible):
@@ -417,24 +530,43 @@ class Track:
             ts, lon, lat, current['ts'], current['lon'], current['lat'])
 
     @classmethod
-    def _calculate_sog(cls, current, past, future):
-        pos_pairs = []
+    def _calculate_sog(cls, current, past, future, past_distance=None):
+        """
+        Calculate sog from the adjacent positions.
+
+        Returns a tuple of the sog and the distances in meters from the past
+        and to the future position (each None if there is no such position).
+        If the distance from the past position is already known, it can be
+        passed as past_distance.
+        """
+        future_distance = None
+        num_pairs = 0
+        acc = 0
         if past:
-            pos_pairs.append((past[-1], current))
+            if past_distance is None:
+                past_distance = great_circle_distance(
+                    past[-1]['lon'], past[-1]['lat'], current['lon'],
+                    current['lat'])
+            acc += cls._speed_in_kts(past[-1], current, past_distance)
+            num_pairs += 1
         if future:
-            pos_pairs.append((current, future[0]))
-        if not pos_pairs:
+            future_distance = great_circle_distance(
+                current['lon'], current['lat'], future[0]['lon'],
+                future[0]['lat'])
+            acc += cls._speed_in_kts(current, future[0], future_distance)
+            num_pairs += 1
+        if not num_pairs:
+            return 0, past_distance, future_distance
+        sog = min(acc / num_pairs, cls.MAX_CALCULATED_SPEED)
+        return sog, past_distance, future_distance
+
+    @staticmethod
+    def _speed_in_kts(left, right, distance):
+        hours = (right['ts'] - left['ts']) / 3600
+        try:
+            return util.m_to_nm(distance / hours)
+        except ZeroDivisionError:
             return 0
-        acc = 0
-        for left, right in pos_pairs:
-            distance = great_circle_distance(
-                left['lon'], left['lat'], right['lon'], right['lat'])
-            hours = (right['ts'] - left['ts']) / 3600
-            try:
-                acc += util.m_to_nm(distance / hours)
-            except ZeroDivisionError:
-                pass
-        return min(acc / len(pos_pairs), cls.MAX_CALCULATED_SPEED)
 
     @classmethod
     def _calculate_cog(cls, current, past, future):
@@ -466,12 +598,15 @@ class Track:
     @property
     def distance(self) -> nr.Number:
         """The track's total distance in meters."""
-        return sum(s.distance for s in self.segments)
+        return sum(map(op.attrgetter('distance'), self.segments))
 
     @property
     def duration(self) -> pendulum.Duration:
-        return sum((s.duration for s in self.segments),
-                   start=pendulum.duration())
+        # Segments connect successive positions, so their durations add up to
+        # the time between the first and last position.
+        if len(self.positions) < 2:
+            return pendulum.duration()
+        return _duration_between(self.positions[0].ts, self.positions[-1].ts)
 
     def append_position(
             self, ts: datetime.datetime, lon: Longitude, lat: Latitude,
@@ -482,11 +617,19 @@ class Track:
 
         Also adds the segment connecting the last position to the new one.
         """
-        pos = self.position_class(
-            ts, lon, lat, sog, cog, heading, tide_flow, tide_bearing)
+        self._append(
+            self.position_class(
+                ts, lon, lat, sog, cog, heading, tide_flow, tide_bearing))
+
+    def _append(self, pos, distance=None):
         self.positions.append(pos)
         try:
-            segment = self.segment_class(self.positions[-2], pos)
-            self.segments.append(segment)
+            prev = self.positions[-2]
         except IndexError:
-            pass
+            return
+        if distance is None:
+            # Custom segment classes may not accept a precomputed distance.
+            segment = self.segment_class(prev, pos)
+        else:
+            segment = self.segment_class(prev, pos, distance)
+        self.segments.append(segment)
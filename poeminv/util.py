@@ -48,13 +48,9 @@ class OpDict(dict):
             for k in set(self) | set(other)})
 
     def __mul__(self, other: dict) -> t.Self:
-        product = {}
-        for key, value in self.items():
-            try:
-                product[key] = value * other[key]
-            except KeyError:
-                product[key] = value
-        return type(self)(product)
+        return type(self)({
+            key: value * other[key] if key in other else value
+            for key, value in self.items()})
 
 
 class ValueContainsEnumType(enum.EnumType):
@@ -18,13 +18,13 @@
 
 import unittest.mock as umock
 
-from hamcrest import *
 import pendulum
 import pytest
 
 import poeminv.config as cfg
 import poeminv.emission as em
 import poeminv.event as event
+import poeminv.util as util
 
 
 def make_ts_speeds_distance_track(*values):
@@ -46,7 +46,18 @@ def make_ts_speeds_distance_track(*values):
     return track
 
 
-@pytest.fixture
+@pytest.fixture(scope='module')
+def decelerating_segment_track():
+    return make_ts_speeds_distance_track((0, 0, 7), 6, (7200, 0, 5))
+
+
+@pytest.fixture(scope='module')
+def three_position_track():
+    return make_ts_speeds_distance_track((0, 0, 10), 10, (5400, 0, 10), 8,
+                                         (9000, 0, 5))
+
+
+@pytest.fixture(scope='class')
 def mocked_segment_sanitizer():
     def adjusted_segment_hours(segment):
         return segment.duration.total_hours()
@@ -90,35 +101,56 @@ class TestSegmentDurationSanitizer:
         assert sanitizer.adjusted_segment_hours(track.segments[0]) == 18
 
 
+@pytest.fixture(scope='module')
+def vessel_info():
+    return cfg.VesselInfo(
+        max_speed=10, engine_kw=1000, engine_rpm=100, engine_category='c3',
+        engine_nox_tier=1, ship_type='container_ship', size=3000,
+        size_unit='teu')
+
+
+class MockEmissionConfig:
+    def __init__(self):
+        self._engine_powers = {}
+        self._emissions = {}
+        self.low_load_adjustment_factors = []
+
+    def engine_power(self, engine_group):
+        return self._engine_powers[engine_group]
+
+    def emissions_from_energy(self, engine_group, kwh):
+        try:
+            return self._emissions[(engine_group, kwh)]
+        except KeyError:
+            return {}
+
+
+class ConfigStub:
+    """
+    Stand-in for a Config.
+
+    Only emission_config_for needs to be a mock, the sea margin is a plain
+    attribute.
+    """
+    __slots__ = ('sea_margin_adjustment_factor', 'emission_config_for')
+
+    def __init__(self, sea_margin_adjustment_factor, emission_config):
+        self.sea_margin_adjustment_factor = sea_margin_adjustment_factor
+        self.emission_config_for = umock.Mock(return_value=emission_config)
+
+
 class TestEmissionCalculator:
+    @pytest.fixture(autouse=True)
+    def reset_segment_sanitizer(self, mocked_segment_sanitizer):
+        yield
+        mocked_segment_sanitizer.reset_mock()
+
     @pytest.fixture
-    def make_calculator(self, mocked_segment_sanitizer):
-        class MockEmissionConfig:
-            def __init__(self):
-                self._engine_powers = {}
-                self._emissions = {}
-                self.low_load_adjustment_factors = []
-
-            def engine_power(self, engine_group):
-                return self._engine_powers[engine_group]
-
-            def emissions_from_energy(self, engine_group, kwh):
-                try:
-                    return self._emissions[(engine_group, kwh)]
-                except KeyError:
-                    return {}
-
-        def factory():
-            calculator = em.EmissionCalculator(
-                umock.Mock(sea_margin_adjustment_factor=1),
-                cfg.VesselInfo(
-                    max_speed=10, engine_kw=1000, engine_rpm=100,
-                    engine_category='c3', engine_nox_tier=1,
-                    ship_type='container_ship', size=3000, size_unit='teu'),
+    def make_calculator(self, mocked_segment_sanitizer, vessel_info):
+        def factory(calculator_class=em.EmissionCalculator):
+            return calculator_class(
+                ConfigStub(1, MockEmissionConfig()), vessel_info,
                 segment_duration_sanitizer=mocked_segment_sanitizer)
-            calculator.config.emission_config_for.return_value = (
-                MockEmissionConfig())
-            return calculator
 
         return factory
 
@@ -149,6 +181,13 @@ class TestEmissionCalculator:
         assert calculator.propulsion_load_at_stw(9.5) == 1
         assert calculator.propulsion_load_at_stw(10) == 1
 
+    def test_propulsion_loads_at_stws_match_single_loads(self, calculator):
+        calculator.config.sea_margin_adjustment_factor = 1.25
+        stws = [0, 1, 5, 9.5, 10, 11]
+        assert calculator.propulsion_loads_at_stws(stws) == [
+            calculator.propulsion_load_at_stw(stw) for stw in stws]
+        assert calculator.propulsion_loads_at_stws([]) == []
+
     def test_segment_propulsion_emissions_on_same_stw(
             self, calculator, emission_config):
         track = make_ts_speeds_distance_track((0, 0, 5), 5, (7200, 0, 5))
@@ -169,13 +208,14 @@ class TestEmissionCalculator:
         assert actual == {'p1': 1}
 
     def test_segment_propulsion_emissions_uses_sanitized_segment_durations(
-            self, calculator, mocked_segment_sanitizer, emission_config):
+            self, calculator, mocked_segment_sanitizer, emission_config,
+            decelerating_segment_track, monkeypatch):
         def adjusted_segment_hours(segment):
             return 2.5
 
         adj_hours = mocked_segment_sanitizer.adjusted_segment_hours
-        adj_hours.side_effect = (adjusted_segment_hours)
-        track = make_ts_speeds_distance_track((0, 0, 7), 6, (7200, 0, 5))
+        monkeypatch.setattr(adj_hours, 'side_effect', adjusted_segment_hours)
+        track = decelerating_segment_track
         expected_load = (0.7**3 + 0.5**3) / 2
         expected_kwh = 1000 * 2.5 * expected_load
         emission_config._emissions[('propulsion', expected_kwh)] = {'p1': 1}
@@ -185,8 +225,8 @@ class TestEmissionCalculator:
         adj_hours.assert_called_once_with(track.segments[0])
 
     def test_segment_propulsion_emissions_adjusts_emissions_for_low_load(
-            self, calculator, emission_config):
-        track = make_ts_speeds_distance_track((0, 0, 7), 6, (7200, 0, 5))
+            self, calculator, emission_config, decelerating_segment_track):
+        track = decelerating_segment_track
         expected_load = (0.7**3 + 0.5**3) / 2
         expected_kwh = 1000 * 2 * expected_load
         emission_config._emissions[('propulsion', expected_kwh)] = {
@@ -218,9 +258,8 @@ class TestEmissionCalculator:
                                                     event.Mode.TRANSIT) == {}
 
     def test_track_emissions_calculates_emissions(
-            self, calculator, emission_config):
-        track = make_ts_speeds_distance_track((0, 0, 10), 10, (5400, 0, 10), 8,
-                                              (9000, 0, 5))
+            self, calculator, emission_config, three_position_track):
+        track = three_position_track
         prop_kwh1 = 1500
         prop_kwh2 = 1000 * ((1 + 0.125) / 2)
         emission_config._engine_powers = {'auxiliary': 200, 'boiler': 400}
@@ -234,11 +273,154 @@ class TestEmissionCalculator:
         calculator.config.emission_config_for.assert_called_once_with(
             calculator.vessel_info, event.Mode.MANEUVERING)
 
-    def test_track_emissions_raises_on_invalid_mode(self, calculator):
-        track = make_ts_speeds_distance_track((0, 0, 10), 10, (5400, 0, 10), 8,
-                                              (9000, 0, 5))
+    def test_looks_up_emission_config_once_per_mode(
+            self, calculator, emission_config):
+        track = make_ts_speeds_distance_track((0, 0, 10), 10, (5400, 0, 10))
+        emission_config._engine_powers = {'auxiliary': 200, 'boiler': 400}
+        calculator.calculate_track_emissions(track, event.Mode.TRANSIT)
+        calculator.calculate_track_emissions(track, event.Mode.TRANSIT)
+        calculator.calculate_mooring_emissions(
+            pendulum.duration(hours=1), event.Mode.HOTELLING)
+        calculator.calculate_mooring_emissions(
+            pendulum.duration(hours=1), event.Mode.HOTELLING)
+        assert calculator.config.emission_config_for.call_args_list == [
+            umock.call(calculator.vessel_info, event.Mode.TRANSIT),
+            umock.call(calculator.vessel_info, event.Mode.HOTELLING)]
+        calculator.vessel_info = cfg.VesselInfo(
+            max_speed=12, engine_kw=2000, engine_rpm=100, engine_category='c3',
+            engine_nox_tier=1, ship_type='container_ship', size=3000,
+            size_unit='teu')
+        calculator.calculate_track_emissions(track, event.Mode.TRANSIT)
+        calculator.config.emission_config_for.assert_called_with(
+            calculator.vessel_info, event.Mode.TRANSIT)
+        assert calculator.config.emission_config_for.call_count == 3
+
+    def test_track_emissions_match_sum_of_segment_emissions(
+            self, calculator, emission_config):
+        track = make_ts_speeds_distance_track((0, 0, 2), 2, (3600, 0, 7), 5,
+                                              (5400, 0, 3), 2, (9000, 0, 9))
+        emission_config._engine_powers = {'auxiliary': 0, 'boiler': 0}
+        emission_config.emissions_from_energy = (
+            lambda engine_group, kwh: {engine_group: kwh})
+        expected = sum((
+            calculator.segment_propulsion_emissions(s, emission_config)
+            for s in track.segments), start=util.OpDict(auxiliary=0, boiler=0))
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual == expected
+
+    def test_track_emissions_uses_overridden_segment_propulsion_emissions(
+            self, make_calculator, three_position_track):
+        class SegmentCountingCalculator(em.EmissionCalculator):
+            def segment_propulsion_emissions(self, segment, emission_config):
+                return util.OpDict(segments=1)
+
+        calculator = make_calculator(SegmentCountingCalculator)
+        emission_config = calculator.config.emission_config_for.return_value
+        emission_config._engine_powers = {'auxiliary': 0, 'boiler': 0}
+        actual = calculator.calculate_track_emissions(
+            three_position_track, event.Mode.TRANSIT)
+        assert actual == {'segments': 2}
+
+    def test_track_emissions_uses_overridden_propulsion_load_at_stw(
+            self, make_calculator):
+        class ConstantLoadCalculator(em.EmissionCalculator):
+            def propulsion_load_at_stw(self, stw):
+                return 0.25
+
+        calculator = make_calculator(ConstantLoadCalculator)
+        emission_config = calculator.config.emission_config_for.return_value
+        emission_config._engine_powers = {'auxiliary': 0, 'boiler': 0}
+        emission_config._emissions[('propulsion', 500)] = {'p1': 1}
+        track = make_ts_speeds_distance_track((0, 0, 5), 5, (7200, 0, 5))
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual == {'p1': 1}
+        actual = calculator.segment_propulsion_emissions(
+            track.segments[0], emission_config)
+        assert actual == {'p1': 1}
+
+    def test_track_emissions_reuses_emissions_for_same_energy(
+            self, calculator, emission_config):
+        track = make_ts_speeds_distance_track((0, 0, 5), 5, (3600, 0, 5), 5,
+                                              (7200, 0, 5))
+        emission_config._engine_powers = {'auxiliary': 200, 'boiler': 400}
+        emission_config._emissions[('propulsion', 125)] = {'p1': 1}
+        emissions_from_energy = umock.Mock(
+            side_effect=emission_config.emissions_from_energy)
+        emission_config.emissions_from_energy = emissions_from_energy
+        calculator.kwh_quantization = 1
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual == {'p1': 2}
+        assert emissions_from_energy.call_args_list == [
+            umock.call('propulsion', 125),
+            umock.call('auxiliary', 400),
+            umock.call('boiler', 800)]
+
+    def test_track_emissions_doesnt_reuse_emissions_without_quantization(
+            self, calculator, emission_config):
+        track = make_ts_speeds_distance_track((0, 0, 5), 5, (3600, 0, 5), 5,
+                                              (7200, 0, 5))
+        emission_config._engine_powers = {'auxiliary': 0, 'boiler': 0}
+        emission_config._emissions[('propulsion', 125)] = {'p1': 1}
+        emissions_from_energy = umock.Mock(
+            side_effect=emission_config.emissions_from_energy)
+        emission_config.emissions_from_energy = emissions_from_energy
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual == {'p1': 2}
+        assert emissions_from_energy.call_args_list.count(
+            umock.call('propulsion', 125)) == 2
+
+    def test_track_emissions_supports_unhashable_emission_configs(
+            self, calculator):
+        class UnhashableEmissionConfig(MockEmissionConfig):
+            __hash__ = None
+
+        emission_config = UnhashableEmissionConfig()
+        emission_config._engine_powers = {'auxiliary': 0, 'boiler': 0}
+        emission_config._emissions[('propulsion', 125)] = {'p1': 1}
+        calculator.config.emission_config_for.return_value = emission_config
+        calculator.kwh_quantization = 5
+        track = make_ts_speeds_distance_track((0, 0, 5), 5, (3600, 0, 5))
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual == {'p1': 1}
+
+    def test_track_emissions_quantizes_kwh_if_requested(
+            self, calculator, emission_config):
+        track = make_ts_speeds_distance_track((0, 0, 5), 5, (3600, 0, 5), 5,
+                                              (7330, 0, 5))
+        emission_config._engine_powers = {'auxiliary': 0, 'boiler': 0}
+        emission_config.emissions_from_energy = (
+            lambda engine_group, kwh: {engine_group: kwh})
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual['propulsion'] == pytest.approx(125 + 125 * 3730 / 3600)
+        calculator.kwh_quantization = 10
+        actual = calculator.calculate_track_emissions(
+            track, event.Mode.TRANSIT)
+        assert actual['propulsion'] == 250
+
+    def test_init_raises_on_invalid_kwh_quantization(self, calculator):
         with pytest.raises(ValueError):
-            calculator.calculate_track_emissions(track, 'not a valid mode')
+            em.EmissionCalculator(
+                calculator.config, calculator.vessel_info, kwh_quantization=0)
+
+    def test_raises_on_invalid_kwh_quantization_assignment(self, calculator):
+        with pytest.raises(ValueError):
+            calculator.kwh_quantization = 0
+        assert calculator.kwh_quantization is None
+
+    def test_track_emissions_raises_on_invalid_mode(
+            self, calculator, three_position_track):
+        with pytest.raises(ValueError):
+            calculator.calculate_track_emissions(
+                three_position_track, 'not a valid mode')
+        with pytest.raises(ValueError):
+            calculator.calculate_track_emissions(
+                three_position_track, ['unhashable'])
 
     def test_mooring_emissions_calculates_emissions(
             self, calculator, emission_config):
@@ -255,3 +437,6 @@ class TestEmissionCalculator:
         with pytest.raises(ValueError):
             calculator.calculate_mooring_emissions(
                 pendulum.duration(hours=1.5), 'not a valid mode')
+        with pytest.raises(ValueError):
+            calculator.calculate_mooring_emissions(
+                pendulum.duration(hours=1.5), ['unhashable'])
@@ -16,6 +16,8 @@
 # along with this program, in the file LICENSE at the top level of this
 # repository. If not, see <https://www.gnu.org/licenses/>.
 
+import decimal
+import functools as ft
 import math
 import unittest.mock as umock
 
@@ -26,10 +28,12 @@ import pytest
 import poeminv.event as event
 
 
+@ft.cache
 def pdts(t):
     return pendulum.from_timestamp(t)
 
 
+@ft.cache
 def d(seconds=0):
     return pendulum.duration(seconds=seconds)
 
@@ -47,6 +51,8 @@ def test_great_circle_distance():
         *lombardsbruecke, *kennedybruecke)
     assert bridge_dist == pytest.approx(97, abs=1)
 
+    assert event.great_circle_distance(*hh, *hh) == 0
+
 
 def test_bearing():
     assert event.bearing(0, 0, 0, 0) == 0
@@ -141,6 +147,19 @@ class TestPosition:
                 ts=pdts(10), lon=11, lat=12, sog=sog, cog=cog, heading=14,
                 tide_flow=tide_flow, tide_bearing=tide_bearing, stw=stw))
 
+    def test_compares_and_reprs_extended_attributes(self):
+        class ExtraPosition(event.Position):
+            _attributes = event.Position._attributes + ('extra',)
+
+            def __init__(self, *args, extra, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.extra = extra
+
+        pos1 = ExtraPosition(pdts(10), 0, 0, 0, 0, 0, extra=1)
+        pos2 = ExtraPosition(pdts(10), 0, 0, 0, 0, 0, extra=2)
+        assert pos1 != pos2
+        assert 'extra: 1' in repr(pos1)
+
     def test_recalculates_stw_on_changed_tide_flow(self):
         pos = event.Position(pdts(10), 0, 0, 6, 0, 0, 2, 180)
         assert pos.stw == 8
@@ -153,6 +172,21 @@ class TestPosition:
         pos.tide_bearing = 270
         assert pos.stw == 5
 
+    def test_recalculates_stw_on_changed_cog(self):
+        pos = event.Position(pdts(10), 0, 0, 4, 0, 0, 3, 180)
+        assert pos.stw == 7
+        pos.cog = 270
+        assert pos.stw == 5
+
+    def test_reuses_tide_angle_on_changed_tide_flow(self, monkeypatch):
+        pos = event.Position(pdts(10), 0, 0, 6, 0, 0, 2, 180)
+        assert pos.stw == 8
+        cos = umock.Mock(wraps=math.cos)
+        monkeypatch.setattr(math, 'cos', cos)
+        pos.tide_flow = 3
+        assert pos.stw == 9
+        cos.assert_not_called()
+
 
 class TestSegment:
     def test_duration(self):
@@ -161,6 +195,12 @@ class TestSegment:
         segment = event.Segment(position1, position2)
         assert segment.duration == d(10)
 
+    def test_duration_keeps_fractional_seconds(self):
+        position1 = event.Position(pdts(10.25), 11, 12, 13, 14, 15, 16, 17)
+        position2 = event.Position(pdts(20), 21, 22, 23, 24, 25, 26, 27)
+        segment = event.Segment(position1, position2)
+        assert segment.duration == pendulum.duration(seconds=9.75)
+
 
 class TestTrack:
     @pytest.fixture
@@ -372,6 +412,86 @@ class TestTrack:
                 has_properties(sog=0), has_properties(sog=1),
                 has_properties(sog=4)))
 
+    def test_sanitized_recovers_from_invalid_coordinates(
+            self, stw_is_plausible):
+        def distance_covered_is_plausible(ts1, lon1, lat1, ts2, lon2, lat2):
+            distance = event.great_circle_distance(lon1, lat1, lon2, lat2)
+            return distance <= 1852 * 30 * (ts2 - ts1) / 3600
+
+        positions = [
+            self.make_pos_dict(60 * i, 0.001 * i, 0, 3, 90, 90)
+            for i in range(20)]
+        positions[5]['lon'] = math.nan
+        track = event.Track.sanitized_from_positions(
+            positions, stw_is_plausible, distance_covered_is_plausible)
+        # The invalid position is discarded, as are the ones whose past
+        # average it is part of, but no others.
+        expected_tss = [pdts(60 * i) for i in range(20) if not 5 <= i <= 8]
+        assert [p.ts for p in track.positions] == expected_tss
+
+    def test_sanitized_accepts_same_values_as_position(
+            self, stw_is_plausible, distance_covered_is_plausible):
+        positions = [self.make_pos_dict(0, 0, 0, math.nan, 0, 0)]
+        track = event.Track.sanitized_from_positions(
+            positions, stw_is_plausible, distance_covered_is_plausible)
+        assert len(track.positions) == 1
+        assert math.isnan(track.positions[0].sog)
+
+    def test_sanitized_converts_values_to_float(
+            self, stw_is_plausible, distance_covered_is_plausible):
+        positions = [
+            self.make_pos_dict(
+                0, decimal.Decimal('1.5'), 2, decimal.Decimal(6), 0, 90)
+            | {'tide_flow': decimal.Decimal(2), 'tide_bearing': 180}]
+        track = event.Track.sanitized_from_positions(
+            positions, stw_is_plausible, distance_covered_is_plausible)
+        [position] = track.positions
+        assert position.stw == 8
+        for name in event.Position._attributes[1:] + ('sog', 'stw'):
+            assert isinstance(getattr(position, name), float)
+
+    def test_sanitized_initializes_position_subclasses(
+            self, stw_is_plausible, distance_covered_is_plausible):
+        class ExtraPosition(event.Position):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.extra = 'extra'
+
+        class ExtraTrack(event.Track):
+            def __init__(self):
+                super().__init__(position_class=ExtraPosition)
+
+        positions = [
+            self.make_pos_dict(0, 0, 0, 1, 0, 0),
+            self.make_pos_dict(10, 1, 1, 1, 0, 0)]
+        track = ExtraTrack.sanitized_from_positions(
+            positions, stw_is_plausible, distance_covered_is_plausible)
+        assert_that(
+            track.positions,
+            only_contains(
+                all_of(
+                    instance_of(ExtraPosition),
+                    has_properties(extra='extra'))))
+
+    def test_sanitized_appends_via_overridden_append_position(
+            self, stw_is_plausible, distance_covered_is_plausible):
+        class CountingTrack(event.Track):
+            def __init__(self):
+                super().__init__()
+                self.num_appended = 0
+
+            def append_position(self, *args, **kwargs):
+                super().append_position(*args, **kwargs)
+                self.num_appended += 1
+
+        positions = [
+            self.make_pos_dict(0, 0, 0, 1, 0, 0),
+            self.make_pos_dict(10, 1, 1, 1, 0, 0)]
+        track = CountingTrack.sanitized_from_positions(
+            positions, stw_is_plausible, distance_covered_is_plausible)
+        assert track.num_appended == 2
+        assert len(track.segments) == 1
+
     def test_sanitized_ignores_invalid_tide_information(
             self, stw_is_plausible, distance_covered_is_plausible):
         positions = [
@@ -413,3 +533,54 @@ class TestTrack:
         track.append_position(pdts(25), 11, 12, 13, 14, 15, 16, 17)
         track.append_position(pdts(120), 21, 22, 23, 24, 25, 26, 27)
         assert track.duration == pendulum.duration(seconds=110)
+
+    def test_duration_is_not_calendar_based(self):
+        track = event.Track()
+        track.append_position(pdts(0), 1, 2, 3, 4, 5, 6, 7)
+        track.append_position(pdts(40 * 86400), 11, 12, 13, 14, 15, 16, 17)
+        assert track.duration.in_words() == '5 weeks 5 days'
+        assert str(track.duration) == '5 weeks 5 days'
+
+    def test_appends_to_segment_classes_without_distance_argument(self):
+        class PlainSegment(event.Segment):
+            def __init__(self, start, end):
+                super().__init__(start, end)
+
+        track = event.Track(segment_class=PlainSegment)
+        track.append_position(pdts(10), 1, 2, 3, 4, 5, 6, 7)
+        track.append_position(pdts(20), 11, 12, 13, 14, 15, 16, 17)
+        assert len(track.segments) == 1
+        assert isinstance(track.segments[0], PlainSegment)
+
+    @pytest.mark.parametrize(
+        'invalid_values', [
+            dict(lon=180),
+            dict(lat=-91),
+            dict(sog=-1),
+            dict(cog=360),
+            dict(heading=-1)])
+    def test_sanitized_raises_on_invalid_values(
+            self, stw_is_plausible, distance_covered_is_plausible,
+            invalid_values):
+        positions = [
+            self.make_pos_dict(0, 0, 0, 0, 0, 0),
+            self.make_pos_dict(3600, 0, 0, 0, 0, 0) | invalid_values]
+        with pytest.raises(ValueError):
+            event.Track.sanitized_from_positions(
+                positions, stw_is_plausible, distance_covered_is_plausible)
+
+    def test_sanitized_reuses_distances_calculated_for_sog(
+            self, stw_is_plausible, distance_covered_is_plausible,
+            monkeypatch):
+        distance = umock.Mock(
+            side_effect=lambda lon1, lat1, lon2, lat2: abs(lon1 - lon2) * 1852)
+        monkeypatch.setattr(event, 'great_circle_distance', distance)
+        positions = [
+            self.make_pos_dict(0, 0, 0, None, 0, 0),
+            self.make_pos_dict(3600, 10, 0, None, 0, 0),
+            self.make_pos_dict(7200, 22, 0, None, 0, 0)]
+        track = event.Track.sanitized_from_positions(
+            positions, stw_is_plausible, distance_covered_is_plausible)
+        assert distance.call_count == 2
+        assert [s.distance for s in track.segments] == [10 * 1852, 12 * 1852]
+        assert distance.call_count == 2